@@ -4,12 +4,6 @@ import argparse
 import datetime
 import sys
 
-from git import Repo
-
-from git.exc import BadName
-from git.exc import InvalidGitRepositoryError
-from git.exc import NoSuchPathError
-
 
 def get_arguments():
     parser = argparse.ArgumentParser()
@@ -32,6 +26,13 @@ def get_arguments():
 def main():
     arguments = get_arguments()
 
+    # GitPython is slow to import, so only do that after parsing arguments
+    from git import Repo
+
+    from git.exc import BadName
+    from git.exc import InvalidGitRepositoryError
+    from git.exc import NoSuchPathError
+
     ref = arguments["ref"]
     path = arguments["repo"]
 
@@ -0,0 +1,522 @@
+#!/usr/bin/python3
+
+"""
+This script answers the same questions as the `cratedeps` shell script (which
+packages require rust-$crate-devel or one of its rust-$crate+*-devel feature
+subpackages), but without running `dnf repoquery` for every crate.
+
+Repository metadata (primary.xml or primary.sqlite) is parsed only once, and the
+resulting index is cached on disk, keyed by the checksum of the repository's
+repomd.xml file. Queries for many crates are then answered from the index.
+"""
+
+import argparse
+import bisect
+import bz2
+import glob
+import gzip
+import hashlib
+import json
+import lzma
+import os
+import pickle
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import xml.etree.ElementTree as ElementTree
+
+from typing import Dict, IO, Iterable, Iterator, List, Optional, Set, Tuple
+
+# bump this when the layout of RepoIndex changes to invalidate cached indexes
+INDEX_FORMAT = 2
+
+# default location of repository metadata downloaded by the `cratedeps` shell script
+DEFAULT_REPO_GLOBS = [
+    "/tmp/dnf/var/cache/libdnf5/rawhide-*",
+    "/tmp/dnf/var/cache/dnf/rawhide-*",
+]
+
+NS_REPO = "{http://linux.duke.edu/metadata/repo}"
+NS_COMMON = "{http://linux.duke.edu/metadata/common}"
+NS_RPM = "{http://linux.duke.edu/metadata/rpm}"
+
+RICH_DEP_TOKENS = re.compile(r"[()]|[^\s()]+(?:\([^\s()]*\))?")
+RICH_DEP_KEYWORDS = {"and", "or", "if", "else", "with", "without", "unless"}
+COMPARISON_FLAGS = {"=": "EQ", "==": "EQ", "<": "LT", "<=": "LE", ">": "GT", ">=": "GE"}
+
+# (epoch, version, release), where release can be None
+EVR = Tuple[str, str, Optional[str]]
+# (flags, evr) - flags is one of EQ, LT, LE, GT, GE
+Constraint = Tuple[str, EVR]
+# sets of constraints, at least one of which needs to be satisfied
+Alternatives = Tuple[Tuple[Constraint, ...], ...]
+# (name, epoch, version, release, arch, source NVR)
+Package = Tuple[str, str, str, str, str, str]
+
+
+def parse_evr(evr: str) -> EVR:
+    if ":" in evr:
+        e, vr = evr.split(":", 1)
+    else:
+        e, vr = "0", evr
+
+    if "-" in vr:
+        v, r = vr.rsplit("-", 1)
+    else:
+        v, r = vr, None
+
+    return e, v, r
+
+
+def parse_rich_dep(dep: str) -> Dict[str, Alternatives]:
+    """
+    This function returns the names of all packages or capabilities that are
+    mentioned in a rich dependency, like
+    "(crate(foo/default) >= 1.0 with crate(foo/default) < 2.0~)",
+    together with the version constraints for each of them.
+
+    Constraints joined by "with" or "and" must all be satisfied by the same
+    provide, while the branches of "or" (and of "if", "unless", and "else") are
+    returned as alternatives. Names on the right side of "without" are ignored.
+    """
+
+    tokens = RICH_DEP_TOKENS.findall(dep)
+    pos = 0
+
+    def parse_expr() -> Dict[str, Alternatives]:
+        nonlocal pos
+
+        result = parse_term()
+        while pos < len(tokens) and tokens[pos] != ")":
+            op = tokens[pos]
+            pos += 1
+            right = parse_term()
+
+            if op in ("with", "and"):
+                result = conjunction(result, right)
+            elif op != "without":
+                result = disjunction(result, right)
+
+        return result
+
+    def parse_term() -> Dict[str, Alternatives]:
+        nonlocal pos
+
+        token = tokens[pos]
+        pos += 1
+
+        if token == "(":
+            result = parse_expr()
+            # skip the closing parenthesis
+            pos += 1
+            return result
+
+        if pos + 1 < len(tokens) and tokens[pos] in COMPARISON_FLAGS:
+            constraint = (COMPARISON_FLAGS[tokens[pos]], parse_evr(tokens[pos + 1]))
+            pos += 2
+            return {token: ((constraint,),)}
+
+        return {token: ((),)}
+
+    try:
+        return parse_expr()
+    except IndexError:
+        # malformed dependency string
+        return dict()
+
+
+def conjunction(left: Dict[str, Alternatives], right: Dict[str, Alternatives]) -> Dict[str, Alternatives]:
+    result = dict(left)
+    for name, alternatives in right.items():
+        if name in result:
+            result[name] = tuple(a + b for a in result[name] for b in alternatives)
+        else:
+            result[name] = alternatives
+    return result
+
+
+def disjunction(left: Dict[str, Alternatives], right: Dict[str, Alternatives]) -> Dict[str, Alternatives]:
+    result = dict(left)
+    for name, alternatives in right.items():
+        result[name] = result.get(name, ()) + alternatives
+    return result
+
+
+def satisfies(provide: Optional[EVR], constraints: Tuple[Constraint, ...]) -> bool:
+    """This function checks whether a provided version satisfies all constraints of a requirement."""
+
+    # unversioned provides and requirements always match
+    if provide is None:
+        return True
+
+    # building the index and matching unversioned provides work without rpm
+    from rpm import labelCompare
+
+    for flags, evr in constraints:
+        pe, pv, pr = provide
+        e, v, r = evr
+
+        # requirements without release match any release
+        if r is None:
+            pr = None
+
+        result = labelCompare((pe, pv, pr), (e, v, r))
+
+        if flags == "EQ" and result != 0:
+            return False
+        if flags == "LT" and result >= 0:
+            return False
+        if flags == "LE" and result > 0:
+            return False
+        if flags == "GT" and result <= 0:
+            return False
+        if flags == "GE" and result < 0:
+            return False
+
+    return True
+
+
+def satisfies_any(provide: Optional[EVR], alternatives: Alternatives) -> bool:
+    return any(satisfies(provide, constraints) for constraints in alternatives)
+
+
+class RepoIndex:
+    """
+    This class holds a compact index of the metadata of one repository:
+
+    - a list of packages (the index into this list is used as package ID),
+    - a sorted list of (package name, package ID) pairs for name lookups,
+    - the list of versioned provides of every package,
+    - a mapping from required names to the IDs of packages which require them.
+    """
+
+    def __init__(self):
+        self.packages: List[Package] = list()
+        self.names: List[Tuple[str, int]] = list()
+        self.provides: List[List[Tuple[str, Optional[EVR]]]] = list()
+        self.requires: Dict[str, List[Tuple[int, Alternatives]]] = dict()
+
+    def add_package(
+        self,
+        package: Package,
+        provides: List[Tuple[str, Optional[EVR]]],
+        requires: List[Tuple[str, Optional[str], Optional[EVR]]],
+    ):
+        pkg_id = len(self.packages)
+
+        self.packages.append(package)
+        self.provides.append(provides)
+
+        for name, flags, evr in requires:
+            if name.startswith("("):
+                for atom, alternatives in parse_rich_dep(name).items():
+                    self.requires.setdefault(atom, []).append((pkg_id, alternatives))
+            elif flags is not None and evr is not None:
+                self.requires.setdefault(name, []).append((pkg_id, (((flags, evr),),)))
+            else:
+                self.requires.setdefault(name, []).append((pkg_id, ((),)))
+
+    def finish(self):
+        self.names = sorted((package[0], pkg_id) for pkg_id, package in enumerate(self.packages))
+
+    def nevra(self, pkg_id: int) -> str:
+        n, e, v, r, a, _ = self.packages[pkg_id]
+        return f"{n}-{e}:{v}-{r}.{a}"
+
+    def find_names(self, name: str) -> List[int]:
+        """This function returns the IDs of all packages with the given name."""
+
+        i = bisect.bisect_left(self.names, (name, -1))
+        ids = []
+        while i < len(self.names) and self.names[i][0] == name:
+            ids.append(self.names[i][1])
+            i += 1
+        return ids
+
+    def find_prefix(self, prefix: str, suffix: str) -> List[int]:
+        """This function returns the IDs of all packages with names matching "{prefix}*{suffix}"."""
+
+        i = bisect.bisect_left(self.names, (prefix, -1))
+        ids = []
+        while i < len(self.names) and self.names[i][0].startswith(prefix):
+            if self.names[i][0].endswith(suffix):
+                ids.append(self.names[i][1])
+            i += 1
+        return ids
+
+    def crate_packages(self, crate: str) -> List[int]:
+        """This function returns the IDs of the rust-$crate-devel and rust-$crate+*-devel packages."""
+
+        return self.find_names(f"rust-{crate}-devel") + self.find_prefix(f"rust-{crate}+", "-devel")
+
+    def what_requires(self, provides: Iterable[Tuple[str, Optional[EVR]]]) -> Set[int]:
+        """This function returns the IDs of all packages that require any of the given provides."""
+
+        requirers = set()
+
+        for name, evr in provides:
+            for requirer, alternatives in self.requires.get(name, ()):
+                if requirer not in requirers and satisfies_any(evr, alternatives):
+                    requirers.add(requirer)
+
+        return requirers
+
+    def to_state(self) -> dict:
+        return {
+            "format": INDEX_FORMAT,
+            "packages": self.packages,
+            "names": self.names,
+            "provides": self.provides,
+            "requires": self.requires,
+        }
+
+    @staticmethod
+    def from_state(state: dict) -> "RepoIndex":
+        index = RepoIndex()
+        index.packages = state["packages"]
+        index.names = state["names"]
+        index.provides = state["provides"]
+        index.requires = state["requires"]
+        return index
+
+
+def open_compressed(path: str) -> IO[bytes]:
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    if path.endswith(".xz"):
+        return lzma.open(path, "rb")
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError(f"The 'zstandard' module is required to read {path}.")
+        return zstandard.open(path, "rb")
+    return open(path, "rb")
+
+
+def read_repomd(repo: str) -> Tuple[str, Dict[str, str]]:
+    """
+    This function reads the repomd.xml file of a repository, and returns its
+    checksum and a mapping from metadata types to the paths of their files.
+    """
+
+    path = os.path.join(repo, "repodata", "repomd.xml")
+
+    with open(path, "rb") as file:
+        contents = file.read()
+
+    checksum = hashlib.sha256(contents).hexdigest()
+
+    locations = dict()
+    root = ElementTree.fromstring(contents)
+    for data in root.iter(f"{NS_REPO}data"):
+        location = data.find(f"{NS_REPO}location")
+        if location is not None:
+            locations[data.get("type")] = os.path.join(repo, location.get("href"))
+
+    return checksum, locations
+
+
+def source_nvr(name: str, version: str, release: str, arch: str, sourcerpm: Optional[str]) -> str:
+    if arch == "src" or not sourcerpm:
+        return f"{name}-{version}-{release}"
+    return sourcerpm.removesuffix(".rpm").removesuffix(".src").removesuffix(".nosrc")
+
+
+def entry_evr(epoch: Optional[str], version: Optional[str], release: Optional[str]) -> Optional[EVR]:
+    if version is None:
+        return None
+    return epoch or "0", version, release
+
+
+def parse_primary_xml(path: str) -> Iterator[Tuple[Package, list, list]]:
+    with open_compressed(path) as file:
+        for _, elem in ElementTree.iterparse(file):
+            if elem.tag != f"{NS_COMMON}package":
+                continue
+
+            if elem.get("type") != "rpm":
+                elem.clear()
+                continue
+
+            name = elem.findtext(f"{NS_COMMON}name")
+            arch = elem.findtext(f"{NS_COMMON}arch")
+            version = elem.find(f"{NS_COMMON}version")
+            fmt = elem.find(f"{NS_COMMON}format")
+
+            e, v, r = version.get("epoch") or "0", version.get("ver"), version.get("rel")
+            sourcerpm = fmt.findtext(f"{NS_RPM}sourcerpm")
+
+            provides = []
+            for entry in fmt.iterfind(f"{NS_RPM}provides/{NS_RPM}entry"):
+                provides.append((entry.get("name"), entry_evr(entry.get("epoch"), entry.get("ver"), entry.get("rel"))))
+
+            requires = []
+            for entry in fmt.iterfind(f"{NS_RPM}requires/{NS_RPM}entry"):
+                requires.append((
+                    entry.get("name"),
+                    entry.get("flags"),
+                    entry_evr(entry.get("epoch"), entry.get("ver"), entry.get("rel")),
+                ))
+
+            yield (name, e, v, r, arch, source_nvr(name, v, r, arch, sourcerpm)), provides, requires
+
+            elem.clear()
+
+
+def parse_primary_db(path: str) -> Iterator[Tuple[Package, list, list]]:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, "primary.sqlite")
+        with open_compressed(path) as src, open(db_path, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+
+        connection = sqlite3.connect(db_path)
+
+        try:
+            provides: Dict[int, list] = dict()
+            for name, epoch, version, release, key in connection.execute(
+                "SELECT name, epoch, version, release, pkgKey FROM provides"
+            ):
+                provides.setdefault(key, []).append((name, entry_evr(epoch, version, release)))
+
+            requires: Dict[int, list] = dict()
+            for name, flags, epoch, version, release, key in connection.execute(
+                "SELECT name, flags, epoch, version, release, pkgKey FROM requires"
+            ):
+                requires.setdefault(key, []).append((name, flags, entry_evr(epoch, version, release)))
+
+            for key, name, e, v, r, arch, sourcerpm in connection.execute(
+                "SELECT pkgKey, name, epoch, version, release, arch, rpm_sourcerpm FROM packages"
+            ):
+                e = e or "0"
+                package = (name, e, v, r, arch, source_nvr(name, v, r, arch, sourcerpm))
+                yield package, provides.get(key, []), requires.get(key, [])
+
+        finally:
+            connection.close()
+
+
+def get_cache_dir() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(cache_home, "miscripts")
+
+
+def build_index(locations: Dict[str, str]) -> RepoIndex:
+    if "primary" in locations:
+        packages = parse_primary_xml(locations["primary"])
+    elif "primary_db" in locations:
+        packages = parse_primary_db(locations["primary_db"])
+    else:
+        raise RuntimeError("Repository metadata contains neither primary.xml nor primary.sqlite.")
+
+    index = RepoIndex()
+    for package, provides, requires in packages:
+        index.add_package(package, provides, requires)
+    index.finish()
+
+    return index
+
+
+def load_index(repo: str, cache_dir: Optional[str] = None) -> RepoIndex:
+    """
+    This function returns the index for the repository at the given path. The
+    index is loaded from the cache if the repository metadata has not changed
+    since it was built, otherwise it is rebuilt and written to the cache.
+    """
+
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+
+    checksum, locations = read_repomd(repo)
+
+    # cached indexes are named after the repository path and its metadata checksum,
+    # so outdated indexes of the same repository can be found and removed
+    repo_key = hashlib.sha256(os.path.abspath(repo).encode()).hexdigest()[:16]
+    cache_prefix = f"repoindex-{repo_key}-"
+    cache_path = os.path.join(cache_dir, f"{cache_prefix}{INDEX_FORMAT}-{checksum}.pickle")
+
+    if os.path.exists(cache_path):
+        with open(cache_path, "rb") as file:
+            return RepoIndex.from_state(pickle.load(file))
+
+    index = build_index(locations)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    with os.fdopen(fd, "wb") as file:
+        pickle.dump(index.to_state(), file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path)
+
+    for path in glob.glob(os.path.join(cache_dir, f"{cache_prefix}*.pickle")):
+        if path != cache_path:
+            os.remove(path)
+
+    return index
+
+
+def find_default_repos() -> List[str]:
+    repos = []
+    for pattern in DEFAULT_REPO_GLOBS:
+        for path in sorted(glob.glob(pattern)):
+            if os.path.exists(os.path.join(path, "repodata", "repomd.xml")):
+                repos.append(path)
+    return repos
+
+
+def crate_dependents(indexes: List[RepoIndex], crate: str) -> List[str]:
+    """This function returns the sorted NEVRAs of all packages which require any package of a crate."""
+
+    # provides and requires can cross repository boundaries (i.e. source packages
+    # from rawhide-source require binary packages from rawhide)
+    provides = []
+    for index in indexes:
+        for pkg_id in index.crate_packages(crate):
+            provides.extend(index.provides[pkg_id])
+
+    nevras = set()
+    for index in indexes:
+        nevras.update(index.nevra(requirer) for requirer in index.what_requires(provides))
+
+    return sorted(nevras)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="List packages which require rust-$crate-devel or rust-$crate+*-devel.",
+    )
+    parser.add_argument("crates", nargs="+", help="names of crates")
+    parser.add_argument("--repo", action="append", default=[],
+                        help="path of repository containing repodata/ (can be repeated; "
+                             "defaults to the rawhide repositories cached by the 'cratedeps' script)")
+    parser.add_argument("--cache-dir", help=f"path of index cache (default: {get_cache_dir()})")
+    parser.add_argument("--json", action="store_true", help="print results as JSON object")
+    args = parser.parse_args()
+
+    repos = args.repo or find_default_repos()
+    if not repos:
+        print("No repositories found. Run 'cratedeps' once or pass '--repo'.", file=sys.stderr)
+        return 1
+
+    indexes = [load_index(repo, args.cache_dir) for repo in repos]
+    results = {crate: crate_dependents(indexes, crate) for crate in args.crates}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    elif len(results) == 1:
+        for nevra in results[args.crates[0]]:
+            print(nevra)
+    else:
+        for crate, nevras in results.items():
+            print(f"{crate}:")
+            for nevra in nevras:
+                print(f"  {nevra}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,178 @@
+#!/usr/bin/python3
+
+"""
+This script provides a single entry point for all scripts in this repository.
+Each script is only imported when its subcommand is run, and scripts import
+heavy dependencies (like koji, rpm, or requests) in the functions that use them,
+so they are not loaded for subcommands or code paths that do not need them.
+
+The "startup-budget" subcommand measures the import time of every subcommand
+(in a fresh python process) and fails if any of them exceeds its budget.
+"""
+
+import os
+import sys
+
+from typing import Dict, List, NamedTuple, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class Command(NamedTuple):
+    path: str
+    help: str
+    # maximum time for importing the script and its dependencies, in milliseconds
+    budget: int
+
+
+COMMANDS: Dict[str, Command] = {
+    "commitdate": Command("commitdate.py", "print committed date of a git ref", 20),
+    "cratedeps": Command("cratedeps.py", "list packages which require a Rust crate", 60),
+    "daemon": Command("miscriptsd.py", "serve or query the warm-state daemon", 30),
+    "manifest-to-provides": Command("manifest_to_provides.py", "convert go manifest to bundled Provides", 10),
+    "mdfmt": Command("mdfmt.py", "align columns of tables in Markdown files", 10),
+    "orphan": Command("orphan.py", "orphan packages on Fedora dist-git", 50),
+    "rebuild-plan": Command("rebuild_plan.py", "compute batches of packages to rebuild", 80),
+    "rust-side-tag-builds": Command("rust_side_tag_builds.py", "build Rust packages for stable branches", 30),
+    "spec-glob-search": Command("spec-glob-search.py", "search .spec files with regular expressions", 60),
+    "vendor2provides": Command("vendor2provides.py", "convert go modules.txt to bundled Provides", 10),
+}
+
+# maximum time for importing only the dispatcher, in milliseconds
+DISPATCHER_BUDGET = 5
+
+# number of runs per subcommand; the fastest run is compared against the budget
+BUDGET_RUNS = 3
+
+
+def load_script(path: str):
+    """This function imports a script in this repository and returns its module."""
+
+    import importlib.util
+
+    module_name = os.path.splitext(os.path.basename(path))[0].replace("-", "_")
+
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(HERE, path))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+
+    return module
+
+
+def load_command(name: str):
+    """This function imports the script that implements a subcommand and returns its module."""
+
+    return load_script(COMMANDS[name].path)
+
+
+def measure_import_time(path: Optional[str]) -> int:
+    """
+    This function returns the time in microseconds it takes to import the
+    dispatcher and, if given, a script (including the execution of its module
+    body), measured in a fresh python process.
+
+    It raises ModuleNotFoundError if a dependency of the script is not installed.
+    """
+
+    import subprocess
+
+    # scripts are executed by load_script() instead of being imported, so they
+    # would not show up in the output of `python -X importtime`
+    code = "import time; start = time.perf_counter(); import miscripts"
+    if path is not None:
+        code += f"; miscripts.load_script({path!r})"
+    code += "; print(round((time.perf_counter() - start) * 1e6))"
+
+    ret = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=HERE,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+    if ret.returncode != 0:
+        error = ret.stderr.decode().strip().split("\n")[-1]
+        if error.startswith("ModuleNotFoundError:"):
+            raise ModuleNotFoundError(error.split(":", 1)[1].strip())
+        raise RuntimeError(error)
+
+    # the measurement is printed last, after any output of the script itself
+    return int(ret.stdout.decode().split()[-1])
+
+
+def startup_budget(args: List[str]) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="miscripts startup-budget",
+        description="Check the import time of subcommands against their budgets.",
+    )
+    parser.add_argument("commands", nargs="*", metavar="command",
+                        help="names of subcommands to check (default: all)")
+    parser.add_argument("--runs", type=int, default=BUDGET_RUNS,
+                        help=f"number of measurements per subcommand (default: {BUDGET_RUNS})")
+    arguments = parser.parse_args(args)
+
+    for name in arguments.commands:
+        if name not in COMMANDS:
+            parser.error(f"unknown command '{name}'")
+
+    checks = [(None, "miscripts", DISPATCHER_BUDGET)]
+    checks.extend((COMMANDS[name].path, name, COMMANDS[name].budget) for name in arguments.commands or COMMANDS)
+
+    failures = 0
+
+    for path, label, budget in checks:
+        try:
+            elapsed = min(measure_import_time(path) for _ in range(arguments.runs)) / 1000
+        except ModuleNotFoundError as exc:
+            # optional dependencies of some scripts are not always installed
+            print(f"{label:<24} skipped: {exc}")
+            continue
+        except RuntimeError as exc:
+            print(f"{label:<24} import failed: {exc}")
+            failures += 1
+            continue
+
+        status = "ok" if elapsed <= budget else "OVER BUDGET"
+        if elapsed > budget:
+            failures += 1
+
+        print(f"{label:<24} {elapsed:8.1f} ms / {budget:4d} ms  {status}")
+
+    return 1 if failures else 0
+
+
+def main() -> int:
+    args = sys.argv[1:]
+
+    if not args or args[0] in ("-h", "--help"):
+        print("usage: miscripts <command> [arguments]")
+        print()
+        print("commands:")
+        for name, command in COMMANDS.items():
+            print(f"  {name:<24}{command.help}")
+        print(f"  {'startup-budget':<24}check import time of commands against their budgets")
+        return 0 if args else 1
+
+    name, args = args[0], args[1:]
+
+    if name == "startup-budget":
+        return startup_budget(args)
+
+    if name not in COMMANDS:
+        print(f"miscripts: unknown command '{name}' (see 'miscripts --help')", file=sys.stderr)
+        return 1
+
+    module = load_command(name)
+
+    sys.argv = [f"miscripts {name}", *args]
+    ret = module.main()
+
+    return ret or 0
+
+
+if __name__ == "__main__":
+    exit(main())
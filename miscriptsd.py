@@ -0,0 +1,295 @@
+#!/usr/bin/python3
+
+"""
+This script runs a long-running daemon that keeps expensive state warm between
+calls from automation: the koji session, results of `list_buildroot()` for
+completed builds, the contents of .spec files, and parsed NEVRs. Requests are
+served over a local Unix socket.
+
+The protocol is one JSON object per line in both directions. Requests look like
+{"method": "nevr_compare", "params": {"a": "...", "b": "..."}}, and responses
+are either {"result": ...} or {"error": "..."}. Clients can send any number of
+requests over one connection.
+
+Methods:
+
+- ping: returns "pong"
+- spec_search (directory, pattern): same results as `spec-glob-search.py query`
+- nevr_compare (a, b): returns -1, 0, or 1
+- list_buildroot (nvr): returns NVRs of the rust-*-devel builds in the buildroot
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+def default_socket_path() -> str:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "miscripts.sock")
+    return f"/tmp/miscripts-{os.getuid()}.sock"
+
+
+class Client:
+    """This class implements a client for the daemon which keeps its connection open between calls."""
+
+    def __init__(self, socket_path: Optional[str] = None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path or default_socket_path())
+        self.file = self.sock.makefile("rwb")
+
+    def call(self, method: str, **params) -> Any:
+        request = {"method": method, "params": params}
+        self.file.write(json.dumps(request).encode() + b"\n")
+        self.file.flush()
+
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("Connection closed by daemon.")
+
+        response = json.loads(line)
+        if "error" in response:
+            raise RuntimeError(response["error"])
+
+        return response["result"]
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+class Daemon:
+    """
+    This class holds the warm state of the daemon and implements its methods.
+
+    The koji session and the function that lists buildroots can be replaced,
+    which allows running the daemon against a fake koji hub.
+    """
+
+    def __init__(
+        self,
+        session_factory: Optional[Callable[[], Any]] = None,
+        buildroot_lister: Optional[Callable[[Any, str], List[str]]] = None,
+    ):
+        import threading
+
+        self.session_factory = session_factory
+        self.buildroot_lister = buildroot_lister
+        self.session = None
+
+        self.koji_lock = threading.Lock()
+        self.buildroots: Dict[str, List[str]] = dict()
+
+        self.specs = None
+        self.index_lock = threading.Lock()
+        self.spec_lines: Dict[str, Tuple[int, int, List[str]]] = dict()
+
+        self.nevrs: Dict[str, Any] = dict()
+
+    def handle(self, request: dict) -> Any:
+        method = request.get("method")
+        params = request.get("params") or dict()
+
+        handler = getattr(self, f"do_{method}", None)
+        if handler is None:
+            raise ValueError(f"Unknown method: {method}")
+
+        return handler(**params)
+
+    def do_ping(self) -> str:
+        return "pong"
+
+    def get_spec_lines(self, path: str) -> List[str]:
+        stat = os.stat(path)
+
+        cached = self.spec_lines.get(path)
+        if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+
+        lines = self.specs.get_spec_lines(path)
+        self.spec_lines[path] = (stat.st_mtime_ns, stat.st_size, lines)
+        return lines
+
+    def do_spec_search(self, pattern: str, directory: str = ".") -> dict:
+        import re
+
+        if self.specs is None:
+            from miscripts import load_command
+            self.specs = load_command("spec-glob-search")
+
+        directory = os.path.abspath(directory)
+        compiled = re.compile(pattern)
+
+        # narrow down the files to search if there is a trigram index
+        index_path = os.path.join(directory, self.specs.INDEX_NAME)
+        if os.path.exists(index_path):
+            # concurrent updates of the same index would insert the same rows twice
+            with self.index_lock:
+                self.specs.update_index(directory, index_path)
+                paths = self.specs.query_index(directory, index_path, compiled)
+        else:
+            paths = self.specs.get_specs(directory)
+
+        affected = 0
+        report = dict()
+
+        for path in paths:
+            result = self.specs.analyze_lines(path, self.get_spec_lines(path), compiled)
+            if result is not None:
+                affected += 1
+                package, statistics = result
+                report[package] = statistics
+
+        return {"affected": affected, "report": report}
+
+    def get_nevr(self, nevr: str):
+        from nevr import NEVR
+
+        parsed = self.nevrs.get(nevr)
+        if parsed is None:
+            parsed = self.nevrs[nevr] = NEVR.from_nevr(nevr)
+        return parsed
+
+    def do_nevr_compare(self, a: str, b: str) -> int:
+        left = self.get_nevr(a)
+        right = self.get_nevr(b)
+
+        if left.name != right.name:
+            raise ValueError(f"Cannot compare versions of different packages: {left.name}, {right.name}")
+
+        if left < right:
+            return -1
+        if left > right:
+            return 1
+        return 0
+
+    def do_list_buildroot(self, nvr: str) -> List[str]:
+        cached = self.buildroots.get(nvr)
+        if cached is not None:
+            return cached
+
+        # koji sessions must not be shared between threads
+        with self.koji_lock:
+            if self.session_factory is None or self.buildroot_lister is None:
+                from rust_side_tag_builds import koji_session, list_buildroot
+                self.session_factory = self.session_factory or koji_session
+                self.buildroot_lister = self.buildroot_lister or list_buildroot
+
+            if self.session is None:
+                self.session = self.session_factory()
+
+            # list_buildroot() fails for incomplete builds, so only immutable results are cached
+            try:
+                result = self.buildroot_lister(self.session, nvr)
+            except Exception:
+                # the session might have expired or lost its connection, so start over with the next call
+                self.session = None
+                raise
+
+        self.buildroots[nvr] = result
+        return result
+
+
+def serve(socket_path: str, daemon: Optional[Daemon] = None):
+    import socketserver
+
+    if daemon is None:
+        daemon = Daemon()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                try:
+                    response = {"result": daemon.handle(json.loads(line))}
+                except Exception as exc:
+                    response = {"error": f"{type(exc).__name__}: {exc}"}
+
+                self.wfile.write(json.dumps(response).encode() + b"\n")
+                self.wfile.flush()
+
+    if os.path.exists(socket_path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+        except ConnectionRefusedError:
+            # left behind by a daemon that was not stopped cleanly
+            os.remove(socket_path)
+        else:
+            raise RuntimeError(f"Another daemon is already listening on {socket_path}.")
+        finally:
+            probe.close()
+
+    server = socketserver.ThreadingUnixStreamServer(socket_path, Handler)
+    server.daemon_threads = True
+    os.chmod(socket_path, 0o600)
+
+    stat = os.stat(socket_path)
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+        # the socket might have been replaced by another daemon in the meantime
+        try:
+            current = os.stat(socket_path)
+        except FileNotFoundError:
+            current = None
+        if current is not None and (current.st_dev, current.st_ino) == (stat.st_dev, stat.st_ino):
+            os.remove(socket_path)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Serve or query the miscripts daemon.")
+    parser.add_argument("--socket", default=default_socket_path(),
+                        help=f"path of the daemon's socket (default: {default_socket_path()})")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("serve", help="run the daemon")
+
+    call_parser = subparsers.add_parser("call", help="send a request to the daemon and print the result")
+    call_parser.add_argument("method", help="name of the method")
+    call_parser.add_argument("params", nargs="?", default="{}", help="parameters as JSON object")
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        import signal
+
+        # make sure the socket is cleaned up when the daemon is stopped
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+        try:
+            serve(args.socket)
+        except RuntimeError as exc:
+            print(exc, file=sys.stderr)
+            return 1
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    try:
+        client = Client(args.socket)
+    except OSError as exc:
+        print(f"Unable to connect to daemon: {exc}", file=sys.stderr)
+        return 1
+
+    try:
+        result = client.call(args.method, **json.loads(args.params))
+    except RuntimeError as exc:
+        print(exc, file=sys.stderr)
+        return 1
+    finally:
+        client.close()
+
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -1,4 +1,8 @@
-from rpm import labelCompare
+def label_compare(a, b) -> int:
+    # parsing NEVRs does not need rpm, only comparing them does
+    from rpm import labelCompare
+
+    return labelCompare(a, b)
 
 
 class NEVR:
@@ -37,7 +41,7 @@ class NEVR:
         if self.name != other.name:
             return NotImplemented
 
-        return labelCompare(
+        return label_compare(
             (self.epoch, self.version, self.release),
             (other.epoch, other.version, other.release)
         ) == -1
@@ -49,7 +53,7 @@ class NEVR:
         if self.name != other.name:
             return NotImplemented
 
-        return labelCompare(
+        return label_compare(
             (self.epoch, self.version, self.release),
             (other.epoch, other.version, other.release)
         ) == 1
@@ -61,7 +65,7 @@ class NEVR:
         if self.name != other.name:
             return False
 
-        return labelCompare(
+        return label_compare(
             (self.epoch, self.version, self.release),
             (other.epoch, other.version, other.release)
         ) == 0
@@ -73,7 +77,7 @@ class NEVR:
         if self.name == other.name:
             return NotImplemented
 
-        return labelCompare(
+        return label_compare(
             (self.epoch, self.version, self.release),
             (other.epoch, other.version, other.release)
         ) != 0
@@ -85,7 +89,7 @@ class NEVR:
         if self.name != other.name:
             return NotImplemented
 
-        return labelCompare(
+        return label_compare(
             (self.epoch, self.version, self.release),
             (other.epoch, other.version, other.release)
         ) != 1
@@ -97,7 +101,7 @@ class NEVR:
         if self.name != other.name:
             return NotImplemented
 
-        return labelCompare(
+        return label_compare(
             (self.epoch, self.version, self.release),
             (other.epoch, other.version, other.release)
         ) != -1
@@ -1,10 +1,21 @@
 #!/usr/bin/python3
 
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from enum import StrEnum
-
-import requests
+from typing import Dict, List, Optional, Set
 
 API_TOKEN = ""
+API_URL = "https://src.fedoraproject.org"
+
+# HTTP status codes which are worth retrying after a delay
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
 
 class OrphanReason(StrEnum):
     LackOfTime = "Lack of time"
@@ -15,15 +26,283 @@ class OrphanReason(StrEnum):
     OrphanedByReleng = "Orphaned by releng"
     Other = "Other"
 
-def orphan(package: str, reason: OrphanReason, reason_info: str):
-    url = f"https://src.fedoraproject.org/_dg/orphan/rpms/{package}"
+
+class RateLimiter:
+    """Spaces out calls to `wait()` so that at most `rate` calls are made per second,
+    across all threads."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if self.interval == 0.0:
+            return
+
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def make_session(token: str, pool_size: int) -> "requests.Session":
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    session.headers["Authorization"] = f"token {token}"
+
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    return session
+
+
+def orphan(
+    package: str,
+    reason: OrphanReason,
+    reason_info: str,
+    session: Optional["requests.Session"] = None,
+    url: str = API_URL,
+):
+    import requests
+
+    url = f"{url}/_dg/orphan/rpms/{package}"
     data = {"orphan_reason": str(reason), "orphan_reason_info": reason_info}
-    headers = {"Authorization": f"token {API_TOKEN}"}
-    ret = requests.post(url, json=data, headers=headers)
+
+    if session is None:
+        headers = {"Authorization": f"token {API_TOKEN}"}
+        ret = requests.post(url, json=data, headers=headers)
+    else:
+        ret = session.post(url, json=data, timeout=60)
+
     ret.raise_for_status()
 
-packages = []
 
-for package in packages:    
-    orphan(package, OrphanReason.DoNotUseIt, "")
+def orphan_with_retries(
+    package: str,
+    reason: OrphanReason,
+    reason_info: str,
+    session: "requests.Session",
+    limiter: RateLimiter,
+    url: str,
+    retries: int,
+    backoff: float,
+):
+    import requests
+
+    attempt = 0
+
+    while True:
+        limiter.wait()
+
+        try:
+            orphan(package, reason, reason_info, session=session, url=url)
+            return
+
+        except requests.HTTPError as exc:
+            if exc.response is None or exc.response.status_code not in RETRY_STATUS:
+                raise
+            if attempt >= retries:
+                raise
+
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt >= retries:
+                raise
+
+        # exponential backoff with some jitter to avoid retrying in lockstep
+        time.sleep(backoff * (2 ** attempt) * random.uniform(1.0, 1.5))
+        attempt += 1
+
+
+def read_package_list(path: str) -> List[str]:
+    """Reads package names from a file, one per line. Empty lines and lines that
+    start with "#" are ignored."""
+
+    with open(path) as file:
+        lines = file.read().split("\n")
+
+    packages = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            packages.append(line)
+
+    return packages
+
+
+def read_results_log(path: str) -> Dict[str, str]:
+    """Returns the most recent status of every package recorded in a results log."""
+
+    results: Dict[str, str] = dict()
+
+    if not os.path.exists(path):
+        return results
+
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # incomplete last line from an interrupted run
+                continue
+            results[entry["package"]] = entry["status"]
+
+    return results
+
+
+def orphan_packages(
+    packages: List[str],
+    reason: OrphanReason,
+    reason_info: str,
+    token: str,
+    url: str = API_URL,
+    workers: int = 4,
+    rate: float = 5.0,
+    retries: int = 5,
+    backoff: float = 1.0,
+    log_path: Optional[str] = None,
+) -> int:
+    """Orphans packages concurrently and returns the number of failures.
+
+    If a results log is given, packages which were already orphaned successfully
+    according to the log are skipped, and the outcome for every package is appended
+    to the log as one JSON object per line.
+    """
+
+    done: Set[str] = set()
+    if log_path is not None:
+        done = set(package for package, status in read_results_log(log_path).items() if status == "ok")
+
+    skipped = done.intersection(packages)
+    if skipped:
+        print(f"Skipping {len(skipped)} package(s) which were already orphaned.")
+
+    todo = list(dict.fromkeys(package for package in packages if package not in done))
+
+    session = make_session(token, workers)
+    limiter = RateLimiter(rate)
+    log_lock = threading.Lock()
+    log = open(log_path, "a") if log_path is not None else None
+
+    failures = 0
+    recorded: Set[Future] = set()
+
+    def record(future: Future):
+        nonlocal failures
+
+        package = futures[future]
+        exc = future.exception()
+
+        if exc is None:
+            entry = {"package": package, "status": "ok"}
+            print(f"Orphaned {package}.")
+        else:
+            failures += 1
+            entry = {"package": package, "status": "failed", "error": str(exc)}
+            print(f"Failed to orphan {package}: {exc}")
+
+        if log is not None:
+            with log_lock:
+                log.write(json.dumps(entry) + "\n")
+                log.flush()
+
+        recorded.add(future)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures = {
+        executor.submit(
+            orphan_with_retries,
+            package, reason, reason_info, session, limiter, url, retries, backoff
+        ): package
+        for package in todo
+    }
+
+    try:
+        for future in as_completed(futures):
+            record(future)
+
+    except KeyboardInterrupt:
+        # do not send any more requests, but wait for those already in flight,
+        # so that their outcome ends up in the results log
+        print("Interrupted, cancelling remaining requests.")
+        executor.shutdown(wait=True, cancel_futures=True)
+
+        for future in futures:
+            if future.done() and not future.cancelled() and future not in recorded:
+                record(future)
+
+        raise
+
+    finally:
+        executor.shutdown(wait=True)
+        session.close()
+        if log is not None:
+            log.close()
+
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Orphan packages on Fedora dist-git.")
+    parser.add_argument("packages", nargs="*", help="names of packages to orphan")
+    parser.add_argument("-f", "--file", action="append", default=[],
+                        help="read package names from file (one per line, can be repeated)")
+    parser.add_argument("--reason", choices=[reason.name for reason in OrphanReason], default="DoNotUseIt",
+                        help="reason for orphaning the packages (default: DoNotUseIt)")
+    parser.add_argument("--info", default="", help="additional information about the reason")
+    parser.add_argument("--token", default=os.environ.get("PAGURE_API_TOKEN", API_TOKEN),
+                        help="dist-git API token (default: $PAGURE_API_TOKEN)")
+    parser.add_argument("--url", default=API_URL, help=f"base URL of dist-git (default: {API_URL})")
+    parser.add_argument("--workers", type=int, default=4, help="number of concurrent requests (default: 4)")
+    parser.add_argument("--rate", type=float, default=5.0,
+                        help="maximum number of requests per second, 0 for no limit (default: 5)")
+    parser.add_argument("--retries", type=int, default=5,
+                        help="number of retries for server errors (default: 5)")
+    parser.add_argument("--backoff", type=float, default=1.0,
+                        help="initial delay between retries in seconds (default: 1)")
+    parser.add_argument("--log", help="append results to this file and skip packages already orphaned in it")
+    args = parser.parse_args()
+
+    packages = list(args.packages)
+    for path in args.file:
+        packages.extend(read_package_list(path))
+
+    if not packages:
+        print("No packages given.")
+        return 1
+
+    try:
+        failures = orphan_packages(
+            packages,
+            OrphanReason[args.reason],
+            args.info,
+            args.token,
+            url=args.url.rstrip("/"),
+            workers=args.workers,
+            rate=args.rate,
+            retries=args.retries,
+            backoff=args.backoff,
+            log_path=args.log,
+        )
+    except KeyboardInterrupt:
+        print("Aborted. Run again with the same '--log' to continue.")
+        return 130
+
+    if failures:
+        print(f"Failed to orphan {failures} package(s).")
+        return 1
+
+    return 0
+
 
+if __name__ == "__main__":
+    exit(main())
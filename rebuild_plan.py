@@ -0,0 +1,237 @@
+#!/usr/bin/python3
+
+"""
+This script computes the set of packages which need to be rebuilt after one or
+more Rust crates were updated: all source packages that depend on the crates,
+either directly or transitively. These packages are grouped into batches, where
+all packages in a batch only depend on packages in earlier batches, so the
+packages in each batch can be built in parallel.
+
+Packages are identified by the NVR of their source package, which is the NVR of
+the rawhide build that `rust_side_tag_builds.py` expects as its first argument.
+With `--batch N`, only the NVRs of one batch are printed, one per line, so they
+can be passed to `rust_side_tag_builds.py` from within the dist-git checkouts:
+
+    for nvr in $(rebuild_plan.py --batch 1 foo); do
+        (cd "${nvr%-*-*}" && rust_side_tag_builds.py "$nvr" f41 f42)
+    done
+"""
+
+import argparse
+import json
+import sys
+
+from collections import deque
+from typing import Dict, Iterable, List, Set, Tuple
+
+from cratedeps import RepoIndex, find_default_repos, load_index
+
+Graph = Dict[str, Set[str]]
+
+
+def binary_packages(indexes: List[RepoIndex]) -> Dict[str, List[Tuple[RepoIndex, int]]]:
+    """This function returns a mapping from source NVRs to the binary packages built from them."""
+
+    binaries: Dict[str, List[Tuple[RepoIndex, int]]] = dict()
+
+    for index in indexes:
+        for pkg_id, package in enumerate(index.packages):
+            if package[4] != "src":
+                binaries.setdefault(package[5], []).append((index, pkg_id))
+
+    return binaries
+
+
+def dependents(
+    indexes: List[RepoIndex],
+    binaries: Dict[str, List[Tuple[RepoIndex, int]]],
+    source: str,
+) -> Set[str]:
+    """This function returns the source NVRs of all packages which require any package built from a source."""
+
+    provides = []
+    for index, pkg_id in binaries.get(source, ()):
+        provides.extend(index.provides[pkg_id])
+
+    result = set()
+    for index in indexes:
+        for requirer in index.what_requires(provides):
+            result.add(index.packages[requirer][5])
+
+    # subpackages requiring other subpackages of the same source are not a dependency
+    result.discard(source)
+    return result
+
+
+def reverse_closure(indexes: List[RepoIndex], seeds: Iterable[str]) -> Graph:
+    """
+    This function returns the graph of all packages which depend on the seed
+    packages, directly or transitively, as a mapping from every package to the
+    set of packages which depend on it.
+    """
+
+    binaries = binary_packages(indexes)
+    graph: Graph = dict()
+
+    queue = deque(seeds)
+    while queue:
+        node = queue.popleft()
+        if node in graph:
+            continue
+
+        graph[node] = dependents(indexes, binaries, node)
+        queue.extend(other for other in graph[node] if other not in graph)
+
+    return graph
+
+
+def strongly_connected_components(graph: Graph, nodes: List[str]) -> List[List[str]]:
+    """
+    This function returns the strongly connected components of the subgraph
+    spanned by the given nodes (using Tarjan's algorithm without recursion).
+
+    Components are returned in reverse topological order: a component is only
+    returned after all components that depend on it.
+    """
+
+    members = set(nodes)
+    indices: Dict[str, int] = dict()
+    lowlinks: Dict[str, int] = dict()
+    stack: List[str] = list()
+    on_stack: Set[str] = set()
+    components: List[List[str]] = list()
+
+    for root in nodes:
+        if root in indices:
+            continue
+
+        indices[root] = lowlinks[root] = len(indices)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(sorted(graph[root] & members)))]
+
+        while work:
+            node, successors = work[-1]
+
+            for successor in successors:
+                if successor not in indices:
+                    indices[successor] = lowlinks[successor] = len(indices)
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(sorted(graph[successor] & members))))
+                    break
+                if successor in on_stack:
+                    lowlinks[node] = min(lowlinks[node], indices[successor])
+
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlinks[parent] = min(lowlinks[parent], lowlinks[node])
+
+                if lowlinks[node] == indices[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.remove(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(sorted(component))
+
+    return components
+
+
+def plan_batches(graph: Graph, seeds: Iterable[str]) -> Tuple[List[List[str]], List[List[str]]]:
+    """
+    This function groups all packages in the graph except for the seeds into
+    batches, so that every package is only built after all packages it depends on.
+    Packages which depend on each other in a cycle are put into the same batch.
+
+    It returns the list of batches and the list of detected cycles.
+    """
+
+    seeds = set(seeds)
+    nodes = sorted(node for node in graph if node not in seeds)
+
+    # reversed, components are in topological order
+    components = strongly_connected_components(graph, nodes)[::-1]
+
+    component_of: Dict[str, int] = dict()
+    for number, component in enumerate(components):
+        for node in component:
+            component_of[node] = number
+
+    layers = [0] * len(components)
+    for number, component in enumerate(components):
+        for node in component:
+            for successor in graph[node]:
+                other = component_of.get(successor)
+                if other is not None and other != number:
+                    layers[other] = max(layers[other], layers[number] + 1)
+
+    batches: List[List[str]] = [[] for _ in range(max(layers, default=-1) + 1)]
+    for number, component in enumerate(components):
+        batches[layers[number]].extend(component)
+
+    cycles = [component for component in components if len(component) > 1]
+
+    return [sorted(batch) for batch in batches], cycles
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Compute batches of packages to rebuild after updating Rust crates.",
+    )
+    parser.add_argument("crates", nargs="+", help="names of updated crates")
+    parser.add_argument("--repo", action="append", default=[],
+                        help="path of repository containing repodata/ (can be repeated; "
+                             "defaults to the rawhide repositories cached by the 'cratedeps' script)")
+    parser.add_argument("--cache-dir", help="path of index cache")
+    parser.add_argument("--json", action="store_true", help="print plan as JSON object")
+    parser.add_argument("--batch", type=int,
+                        help="only print the NVRs of the packages in this batch (starting at 1), "
+                             "one per line, for example to pass them to 'rust_side_tag_builds.py'")
+    args = parser.parse_args()
+
+    repos = args.repo or find_default_repos()
+    if not repos:
+        print("No repositories found. Run 'cratedeps' once or pass '--repo'.", file=sys.stderr)
+        return 1
+
+    indexes = [load_index(repo, args.cache_dir) for repo in repos]
+
+    seeds = set()
+    for crate in args.crates:
+        for index in indexes:
+            seeds.update(index.packages[pkg_id][5] for pkg_id in index.crate_packages(crate))
+
+    if not seeds:
+        print("None of the crates were found in the repositories.", file=sys.stderr)
+        return 1
+
+    graph = reverse_closure(indexes, seeds)
+    batches, cycles = plan_batches(graph, seeds)
+
+    for cycle in cycles:
+        print(f"Dependency cycle between: {', '.join(cycle)}", file=sys.stderr)
+
+    if args.batch is not None:
+        if not 1 <= args.batch <= len(batches):
+            print(f"Batch {args.batch} does not exist, the plan has {len(batches)} batch(es).", file=sys.stderr)
+            return 1
+        for nvr in batches[args.batch - 1]:
+            print(nvr)
+    elif args.json:
+        print(json.dumps({"seeds": sorted(seeds), "batches": batches, "cycles": cycles}, indent=2))
+    else:
+        for number, batch in enumerate(batches, 1):
+            print(f"# batch {number}")
+            for nvr in batch:
+                print(nvr)
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -5,52 +5,70 @@ import subprocess
 import textwrap
 from typing import List, Optional
 
-import koji
-import parse
+# miscriptsd.py imports list_buildroot() from here, so koji and parse are
+# only imported by the functions that need them
 
-SIDE_TAG_PARSER = parse.Parser("Side tag '{tag}' (id {id}) created.")
+SIDE_TAG_FORMAT = "Side tag '{tag}' (id {id}) created."
 
+# maximum number of calls sent to the koji hub in one multicall request
+MULTICALL_BATCH = 100
+
+
+def koji_session() -> "koji.ClientSession":
+    import koji
 
-def koji_session() -> koji.ClientSession:
     module = koji.get_profile_module("koji")
     session_opts = koji.grab_session_options(module.config)
     session = koji.ClientSession(module.config.server, session_opts)
     return session
 
 
-def list_buildroot(session: koji.ClientSession, nvr: str) -> List[str]:
+def list_buildroot(session: "koji.ClientSession", nvr: str) -> List[str]:
+    import koji
+
     build = session.getBuild(nvr, strict=True)
 
     if build["state"] != koji.BUILD_STATES["COMPLETE"]:
         raise Exception("Build is not yet complete.")
 
-    task = session.listTasks(
+    tasks = session.listTasks(
         opts={
             "method": "buildArch",
             "parent": build["task_id"],
         },
-        queryOpts={"limit": 1}
-    )[0]
-
-    buildroot = session.listBuildroots(
-        taskID=task["id"],
-        queryOpts={"order": "-id", "limit": 1}
-    )[0]
-
-    rpms = session.listRPMs(componentBuildrootID=buildroot["id"])
+    )
 
+    # arch-specific dependencies can differ between the buildroots of different
+    # architectures, so the latest buildroot of every buildArch task is used
     with session.multicall(strict=True) as multi:
-        srpms = [
-            multi.listRPMs(
-                buildID=rpm['build_id'],
-                arches='src',
-                queryOpts={'limit': 1}
+        task_buildroots = [
+            multi.listBuildroots(
+                taskID=task["id"],
+                queryOpts={"order": "-id", "limit": 1}
             )
-            for rpm in rpms
-            if rpm['name'].startswith('rust-') and rpm['name'].endswith('-devel')
+            for task in tasks
         ]
 
-    nvrs = set(data.result[0]['nvr'] for data in srpms)
+    buildroots = [data.result[0] for data in task_buildroots if data.result]
+
+    with session.multicall(strict=True, batch=MULTICALL_BATCH) as multi:
+        buildroot_rpms = [
+            multi.listRPMs(componentBuildrootID=buildroot["id"])
+            for buildroot in buildroots
+        ]
+
+    # many RPMs (from different buildroots or subpackages) map to the same build
+    build_ids = set(
+        rpm["build_id"]
+        for data in buildroot_rpms
+        for rpm in data.result
+        if rpm["name"].startswith("rust-") and rpm["name"].endswith("-devel")
+    )
+
+    with session.multicall(strict=True, batch=MULTICALL_BATCH) as multi:
+        builds = [multi.getBuild(build_id) for build_id in sorted(build_ids)]
+
+    nvrs = set(data.result["nvr"] for data in builds)
     return [*sorted(nvrs)]
 
 
@@ -64,12 +82,14 @@ def fedpkg_switch_branch(branch: str):
 
 
 def fedpkg_request_side_tag(branch: str) -> str:
+    import parse
+
     ret = subprocess.run(["fedpkg", "request-side-tag"], stdout=subprocess.PIPE)
     ret.check_returncode()
     side_tag_output = ret.stdout.decode()
 
     try:
-        parsed = SIDE_TAG_PARSER.parse(side_tag_output.split("\n")[0])
+        parsed = parse.parse(SIDE_TAG_FORMAT, side_tag_output.split("\n")[0])
         tag = parsed.named["tag"]
         yde = parsed.named["id"]
         assert f"{branch}-build-side-{yde}" == tag
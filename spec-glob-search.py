@@ -1,16 +1,39 @@
 #!/usr/bin/python3
 
 import argparse
+import array
+import bisect
 import json
 import os
 import pprint
 import re
+import sqlite3
 import sys
+import zlib
 
-from typing import Dict, List, Optional, Tuple, Union
+from typing import Dict, FrozenSet, Iterable, List, Optional, Pattern, Set, Tuple, Union
+
+try:
+    import re._parser as sre_parse
+except ImportError:
+    import sre_parse
 
 PATTERN = re.compile("%{_libdir}/(lib)?[a-zA-Z0-9]*\*[.]?so[.]?\*")
 
+INDEX_NAME = ".spec-index.sqlite"
+INDEX_VERSION = 1
+COMMANDS = ("index", "query")
+
+# POSSESSIVE_REPEAT is only available with python 3.11 or later
+REPEAT_OPS = tuple(
+    op for op in (getattr(sre_parse, name, None) for name in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT"))
+    if op is not None
+)
+
+# alternatives of a regular expression with more required trigram sets than this
+# are merged into one set that only contains the trigrams common to all of them
+MAX_ALTERNATIVES = 32
+
 if (sys.version_info.major == 3) and (sys.version_info.minor < 6):
     print("python 3.6 or later is required to run this script.")
     exit(1)
@@ -19,8 +42,32 @@ if (sys.version_info.major == 3) and (sys.version_info.minor < 6):
 def main():
     arguments = get_arguments()
 
-    specs = get_specs(arguments["directory"])
-    affected, report = analyze_specs(specs)
+    if arguments["command"] == "index":
+        index_path = arguments["index"] or os.path.join(arguments["directory"], INDEX_NAME)
+        updated, removed = update_index(arguments["directory"], index_path)
+        print(f"Index updated: {updated} file(s) (re-)indexed, {removed} file(s) removed.")
+        return
+
+    if arguments["command"] == "query":
+        pattern = re.compile(arguments["pattern"])
+        index_path = arguments["index"] or os.path.join(arguments["directory"], INDEX_NAME)
+
+        if arguments["update"] or not os.path.exists(index_path):
+            update_index(arguments["directory"], index_path)
+
+        try:
+            specs = query_index(arguments["directory"], index_path, pattern)
+        except (ValueError, sqlite3.Error) as exc:
+            print(exc, file=sys.stderr)
+            exit(1)
+
+        affected, report = analyze_specs(specs, pattern)
+        summary = "Number of packages matching the pattern"
+
+    else:
+        specs = get_specs(arguments["directory"])
+        affected, report = analyze_specs(specs)
+        summary = "Number of packages using globs for shared libraries"
 
     if arguments["print"]:
         print_report(report)
@@ -29,22 +76,44 @@ def main():
         write_report(report)
 
     print()
-    print(f"Number of packages using globs for shared libraries: {affected}")
+    print(f"{summary}: {affected}")
     print()
 
 
 def get_arguments() -> dict:
     """This function returns a dictionary containing the parsed command line arguments."""
 
-    cli_parser = argparse.ArgumentParser()
+    argv = sys.argv[1:]
+    if argv and argv[0] in COMMANDS:
+        command = argv.pop(0)
+    else:
+        command = "scan"
+
+    cli_parser = argparse.ArgumentParser(prog=None if command == "scan" else f"{sys.argv[0]} {command}")
+
+    if command == "query":
+        cli_parser.add_argument("pattern", action="store",
+                                help="regular expression to match against the start of lines")
+
     cli_parser.add_argument("directory", action="store", nargs="?", default=".",
                             help="path of directory containing .spec files (defaults to '.')")
-    cli_parser.add_argument("--report", action="store_const", const=True, default=False,
-                            help="enable generating 'report.json'")
-    cli_parser.add_argument("--no-print", action="store_const", const=False, default=True,
-                            help="disable printing report to standard output", dest="print")
 
-    arguments = vars(cli_parser.parse_args())
+    if command in COMMANDS:
+        cli_parser.add_argument("--index", action="store", default=None,
+                                help=f"path of index file (defaults to '{INDEX_NAME}' in the directory)")
+
+    if command == "query":
+        cli_parser.add_argument("--no-update", action="store_const", const=False, default=True,
+                                help="do not update the index before running the query", dest="update")
+
+    if command != "index":
+        cli_parser.add_argument("--report", action="store_const", const=True, default=False,
+                                help="enable generating 'report.json'")
+        cli_parser.add_argument("--no-print", action="store_const", const=False, default=True,
+                                help="disable printing report to standard output", dest="print")
+
+    arguments = vars(cli_parser.parse_args(argv))
+    arguments["command"] = command
     return arguments
 
 
@@ -67,13 +136,13 @@ def get_specs(directory: str) -> List[str]:
     return paths
 
 
-def analyze_specs(paths: List[str]) -> Tuple[int,
-                                             Dict[str, List[Dict[str, Union[int, str]]]]]:
+def analyze_specs(paths: List[str], pattern: Pattern = PATTERN) -> Tuple[int,
+                                                                         Dict[str, List[Dict[str, Union[int, str]]]]]:
     affected = 0
     report = dict()
 
     for path in paths:
-        result = analyze_spec(path)
+        result = analyze_spec(path, pattern)
 
         if result is None:
             continue
@@ -86,13 +155,17 @@ def analyze_specs(paths: List[str]) -> Tuple[int,
     return affected, report
 
 
-def analyze_spec(path: str) -> Optional[Tuple[str, List[Dict[str, Union[int, str]]]]]:
+def analyze_spec(path: str, pattern: Pattern = PATTERN) -> Optional[Tuple[str, List[Dict[str, Union[int, str]]]]]:
     lines = get_spec_lines(path)
+    return analyze_lines(path, lines, pattern)
+
 
+def analyze_lines(path: str, lines: List[str],
+                  pattern: Pattern = PATTERN) -> Optional[Tuple[str, List[Dict[str, Union[int, str]]]]]:
     matches = list()
 
     for lineno, line in enumerate(lines):
-        match = PATTERN.match(line)
+        match = pattern.match(line)
         if match is not None:
             matches.append((lineno, line))
 
@@ -117,5 +190,308 @@ def get_file_content(path: str) -> str:
         return f.read()
 
 
+def get_trigrams(contents: str) -> Set[str]:
+    """This function returns the set of (lower-case) trigrams that occur within the lines of a file."""
+
+    trigrams = set()
+
+    for line in contents.lower().split("\n"):
+        trigrams.update(line[i:i + 3] for i in range(len(line) - 2))
+
+    return trigrams
+
+
+def encode_ids(ids: Iterable[int]) -> bytes:
+    # IDs are stored as compressed, sorted arrays, which can be decoded,
+    # modified, and encoded again without looping over them in python
+    return zlib.compress(array.array("I", sorted(ids)).tobytes(), 1)
+
+
+def decode_ids(blob: bytes) -> array.array:
+    ids = array.array("I")
+    ids.frombytes(zlib.decompress(blob))
+    return ids
+
+
+def update_ids(ids: array.array, removed: Set[int], added: List[int]) -> Tuple[array.array, bool]:
+    """
+    This function removes and adds file IDs to a sorted array of IDs. It returns
+    the updated array, and whether its contents have changed.
+    """
+
+    removed = removed.difference(added)
+    changed = False
+
+    if len(removed) > 64:
+        length = len(ids)
+        ids = array.array("I", (file_id for file_id in ids if file_id not in removed))
+        changed = len(ids) != length
+    else:
+        for file_id in removed:
+            i = bisect.bisect_left(ids, file_id)
+            if i < len(ids) and ids[i] == file_id:
+                del ids[i]
+                changed = True
+
+    if len(added) > 64:
+        length = len(ids)
+        ids = array.array("I", sorted(set(ids).union(added)))
+        changed = changed or len(ids) != length
+    else:
+        for file_id in added:
+            i = bisect.bisect_left(ids, file_id)
+            if i == len(ids) or ids[i] != file_id:
+                ids.insert(i, file_id)
+                changed = True
+
+    return ids, changed
+
+
+def open_index(index_path: str) -> sqlite3.Connection:
+    """This function opens the index for updating it, creating or migrating its tables if necessary."""
+
+    # concurrent updates wait for each other instead of failing right away
+    connection = sqlite3.connect(index_path, timeout=300)
+
+    # take the write lock before reading, so two processes cannot both rebuild the index
+    connection.execute("BEGIN IMMEDIATE")
+
+    # indexes in an older format are rebuilt from scratch
+    (version,) = connection.execute("PRAGMA user_version").fetchone()
+    if version != INDEX_VERSION:
+        connection.execute("DROP TABLE IF EXISTS files")
+        connection.execute("DROP TABLE IF EXISTS postings")
+        connection.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+
+    # files.trigrams holds the IDs of the posting lists that contain the file
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS files "
+        "(id INTEGER PRIMARY KEY, name TEXT UNIQUE, mtime INTEGER, size INTEGER, trigrams BLOB)"
+    )
+    connection.execute("CREATE TABLE IF NOT EXISTS postings (id INTEGER PRIMARY KEY, trigram TEXT UNIQUE, ids BLOB)")
+    connection.commit()
+    return connection
+
+
+def open_index_readonly(index_path: str) -> sqlite3.Connection:
+    """
+    This function opens the index for running queries. Queries neither modify
+    the index nor take its write lock, so they do not wait for running updates.
+    """
+
+    import urllib.parse
+
+    uri = "file:" + urllib.parse.quote(os.path.abspath(index_path)) + "?mode=ro"
+    connection = sqlite3.connect(uri, uri=True)
+
+    (version,) = connection.execute("PRAGMA user_version").fetchone()
+    if version != INDEX_VERSION:
+        connection.close()
+        raise ValueError(f"Index {index_path} is missing or outdated, run the 'index' command first.")
+
+    return connection
+
+
+def load_postings(connection: sqlite3.Connection, column: str, keys: Iterable,
+                  postings: Dict[str, List]):
+    """This function loads the posting lists with the given IDs or trigrams into a dictionary."""
+
+    keys = list(keys)
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        query = f"SELECT id, trigram, ids FROM postings WHERE {column} IN ({', '.join('?' * len(chunk))})"
+        for row_id, trigram, blob in connection.execute(query, chunk):
+            postings[trigram] = [row_id, decode_ids(blob)]
+
+
+def update_index(directory: str, index_path: str) -> Tuple[int, int]:
+    """
+    This function updates the trigram index for the .spec files in the specified
+    directory. Only files which were added, modified, or removed since the last
+    update are processed, and only the posting lists of trigrams that occur in
+    these files are rewritten. It returns the number of (re-)indexed and removed files.
+    """
+
+    connection = open_index(index_path)
+
+    try:
+        # files are only compared with the index after taking the write lock,
+        # otherwise concurrent updates would index the same files twice
+        connection.execute("BEGIN IMMEDIATE")
+
+        indexed = dict()
+        for file_id, name, mtime, size in connection.execute("SELECT id, name, mtime, size FROM files"):
+            indexed[name] = (file_id, mtime, size)
+
+        current = dict()
+        for path in get_specs(directory):
+            stat = os.stat(path)
+            current[os.path.basename(path)] = (stat.st_mtime_ns, stat.st_size)
+
+        removed = [name for name in indexed if name not in current]
+        changed = [name for name in current if name in indexed and indexed[name][1:] != current[name]]
+        added = [name for name in current if name not in indexed]
+
+        if not (removed or changed or added):
+            return 0, 0
+
+        stale = set(indexed[name][0] for name in removed + changed)
+
+        next_id = max((file_id for file_id, _, _ in indexed.values()), default=-1) + 1
+        for name in added:
+            indexed[name] = (next_id, None, None)
+            next_id += 1
+
+        new_postings: Dict[str, List[int]] = dict()
+        for name in changed + added:
+            file_id = indexed[name][0]
+            for trigram in get_trigrams(get_file_content(os.path.join(directory, name))):
+                new_postings.setdefault(trigram, []).append(file_id)
+
+        # trigram -> [posting list ID, sorted array of file IDs]
+        postings: Dict[str, List] = dict()
+
+        old_rows = set()
+        for name in removed + changed:
+            (blob,) = connection.execute("SELECT trigrams FROM files WHERE name = ?", (name,)).fetchone()
+            old_rows.update(decode_ids(blob))
+
+        load_postings(connection, "id", old_rows, postings)
+        load_postings(connection, "trigram", (trigram for trigram in new_postings if trigram not in postings), postings)
+
+        for trigram in new_postings:
+            postings.setdefault(trigram, [None, array.array("I")])
+
+        # modified files mostly contain the same trigrams as before, so only
+        # posting lists whose contents actually change are written back
+        for trigram, entry in postings.items():
+            row_id, ids = entry
+            ids, modified = update_ids(ids, stale, new_postings.get(trigram, []))
+
+            if row_id is None:
+                entry[0] = connection.execute(
+                    "INSERT INTO postings (trigram, ids) VALUES (?, ?)", (trigram, encode_ids(ids))
+                ).lastrowid
+            elif not modified:
+                continue
+            elif ids:
+                connection.execute("UPDATE postings SET ids = ? WHERE id = ?", (encode_ids(ids), row_id))
+            else:
+                connection.execute("DELETE FROM postings WHERE id = ?", (row_id,))
+
+        file_rows: Dict[int, List[int]] = dict()
+        for trigram, ids in new_postings.items():
+            row_id = postings[trigram][0]
+            for file_id in ids:
+                file_rows.setdefault(file_id, []).append(row_id)
+
+        connection.executemany("DELETE FROM files WHERE name = ?", ((name,) for name in removed))
+        connection.executemany(
+            "INSERT OR REPLACE INTO files (id, name, mtime, size, trigrams) VALUES (?, ?, ?, ?, ?)",
+            (
+                (indexed[name][0], name, *current[name], encode_ids(file_rows.get(indexed[name][0], ())))
+                for name in changed + added
+            )
+        )
+
+        connection.commit()
+        return len(changed) + len(added), len(removed)
+
+    finally:
+        connection.close()
+
+
+def and_trigrams(left: List[FrozenSet[str]], right: List[FrozenSet[str]]) -> List[FrozenSet[str]]:
+    combined = list(set(a | b for a in left for b in right))
+
+    if len(combined) > MAX_ALTERNATIVES:
+        combined = [frozenset.intersection(*combined)]
+
+    return combined
+
+
+def required_trigrams(parsed) -> List[FrozenSet[str]]:
+    """
+    This function returns the trigrams which any match of a parsed regular
+    expression must contain, as a list of alternatives: every match contains all
+    trigrams of at least one of the returned sets.
+
+    An empty set in the result means that nothing is known about matches.
+    """
+
+    alternatives = [frozenset()]
+    literal = ""
+
+    for op, av in list(parsed) + [(None, None)]:
+        if op is sre_parse.LITERAL:
+            literal += chr(av).lower()
+            continue
+
+        # any other element ends a sequence of literal characters
+        if len(literal) >= 3:
+            trigrams = frozenset(literal[i:i + 3] for i in range(len(literal) - 2))
+            alternatives = and_trigrams(alternatives, [trigrams])
+        literal = ""
+
+        if op is sre_parse.SUBPATTERN:
+            alternatives = and_trigrams(alternatives, required_trigrams(av[-1]))
+
+        elif op in REPEAT_OPS:
+            minimum, _, sub = av
+            if minimum >= 1:
+                alternatives = and_trigrams(alternatives, required_trigrams(sub))
+
+        elif op is sre_parse.BRANCH:
+            branches = []
+            for branch in av[1]:
+                branches.extend(required_trigrams(branch))
+            if frozenset() in branches:
+                branches = [frozenset()]
+            alternatives = and_trigrams(alternatives, branches)
+
+    return alternatives
+
+
+def query_index(directory: str, index_path: str, pattern: Pattern) -> List[str]:
+    """
+    This function returns the list of .spec files which can contain matches for
+    the specified pattern, according to the trigram index.
+    """
+
+    alternatives = required_trigrams(sre_parse.parse(pattern.pattern, pattern.flags))
+
+    connection = open_index_readonly(index_path)
+
+    try:
+        names = dict(connection.execute("SELECT id, name FROM files"))
+
+        if frozenset() in alternatives:
+            candidates = set(names)
+
+        else:
+            postings: Dict[str, Set[int]] = dict()
+            for trigram in set().union(*alternatives):
+                row = connection.execute("SELECT ids FROM postings WHERE trigram = ?", (trigram,)).fetchone()
+                postings[trigram] = set(decode_ids(row[0])) if row is not None else set()
+
+            candidates = set()
+            for trigrams in alternatives:
+                ordered = sorted(trigrams, key=lambda trigram: len(postings[trigram]))
+                matching = set(postings[ordered[0]])
+                for trigram in ordered[1:]:
+                    matching.intersection_update(postings[trigram])
+                    if not matching:
+                        break
+                candidates.update(matching)
+
+    finally:
+        connection.close()
+
+    paths = list(os.path.join(directory, names[file_id]) for file_id in candidates)
+
+    paths.sort()
+    return paths
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,266 @@
+#!/usr/bin/python3
+
+"""
+This script checks the index of repository metadata built by cratedeps.py
+against small repositories which are generated in a temporary directory.
+
+It can be run with `python3 -m unittest test_cratedeps` or with pytest.
+"""
+
+import glob
+import gzip
+import hashlib
+import os
+import re
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+import unittest.mock
+import xml.etree.ElementTree as ElementTree
+
+from typing import Iterable, List, Optional, Tuple, Union
+
+import cratedeps
+
+
+def rpmvercmp(a: str, b: str) -> int:
+    """This function is a simplified version of rpm's version comparison, which is enough for these tests."""
+
+    segments_a = re.findall(r"~|\d+|[a-zA-Z]+", a)
+    segments_b = re.findall(r"~|\d+|[a-zA-Z]+", b)
+
+    for x, y in zip(segments_a, segments_b):
+        if x == y:
+            continue
+        if x == "~" or y == "~":
+            return -1 if x == "~" else 1
+        if x.isdigit() and y.isdigit():
+            return -1 if int(x) < int(y) else 1
+        if x.isdigit() or y.isdigit():
+            return 1 if x.isdigit() else -1
+        return -1 if x < y else 1
+
+    rest_a = segments_a[len(segments_b):]
+    rest_b = segments_b[len(segments_a):]
+    if rest_a:
+        return -1 if rest_a[0] == "~" else 1
+    if rest_b:
+        return 1 if rest_b[0] == "~" else -1
+    return 0
+
+
+def label_compare(a: Tuple, b: Tuple) -> int:
+    for x, y in zip(a, b):
+        if x is None or y is None:
+            continue
+        result = rpmvercmp(x, y)
+        if result != 0:
+            return result
+    return 0
+
+
+try:
+    import rpm  # noqa: F401
+except ImportError:
+    sys.modules["rpm"] = types.SimpleNamespace(labelCompare=label_compare)
+
+
+# name, or (name, flags, version)
+Entry = Union[str, Tuple[str, str, str]]
+
+
+def rich_range(name: str, lower: str, upper: str) -> str:
+    return f"({name} >= {lower} with {name} < {upper})"
+
+
+def package(name: str, version: str, arch: str, provides: List[Entry], requires: List[Entry],
+            sourcerpm: Optional[str] = None) -> dict:
+    return {
+        "name": name,
+        "version": version,
+        "arch": arch,
+        "provides": provides,
+        "requires": requires,
+        "sourcerpm": sourcerpm,
+    }
+
+
+def devel_package(crate: str, version: str, requires: Iterable[Entry] = (), feature: Optional[str] = None) -> dict:
+    if feature is None:
+        name = f"rust-{crate}-devel"
+        capability = f"crate({crate})"
+    else:
+        name = f"rust-{crate}+{feature}-devel"
+        capability = f"crate({crate}/{feature})"
+
+    return package(
+        name, version, "noarch", [name, (capability, "EQ", version)], list(requires),
+        f"rust-{crate}-{version}-1.fc42.src.rpm",
+    )
+
+
+def write_repo(path: str, packages: List[dict]):
+    """This function writes repodata/repomd.xml and repodata/primary.xml.gz for the given packages."""
+
+    common = "http://linux.duke.edu/metadata/common"
+    rpm_ns = "http://linux.duke.edu/metadata/rpm"
+
+    metadata = ElementTree.Element(f"{{{common}}}metadata", packages=str(len(packages)))
+
+    for pkg in packages:
+        element = ElementTree.SubElement(metadata, f"{{{common}}}package", type="rpm")
+        ElementTree.SubElement(element, f"{{{common}}}name").text = pkg["name"]
+        ElementTree.SubElement(element, f"{{{common}}}arch").text = pkg["arch"]
+        ElementTree.SubElement(element, f"{{{common}}}version", epoch="0", ver=pkg["version"], rel="1.fc42")
+
+        fmt = ElementTree.SubElement(element, f"{{{common}}}format")
+        ElementTree.SubElement(fmt, f"{{{rpm_ns}}}sourcerpm").text = pkg["sourcerpm"] or ""
+
+        for kind in ("provides", "requires"):
+            entries = ElementTree.SubElement(fmt, f"{{{rpm_ns}}}{kind}")
+            for entry in pkg[kind]:
+                if isinstance(entry, str):
+                    ElementTree.SubElement(entries, f"{{{rpm_ns}}}entry", name=entry)
+                else:
+                    name, flags, version = entry
+                    ElementTree.SubElement(entries, f"{{{rpm_ns}}}entry",
+                                           name=name, flags=flags, epoch="0", ver=version)
+
+    os.makedirs(os.path.join(path, "repodata"), exist_ok=True)
+    with gzip.open(os.path.join(path, "repodata", "primary.xml.gz"), "wb") as file:
+        file.write(ElementTree.tostring(metadata))
+
+    repo = "http://linux.duke.edu/metadata/repo"
+    repomd = ElementTree.Element(f"{{{repo}}}repomd")
+    data = ElementTree.SubElement(repomd, f"{{{repo}}}data", type="primary")
+    ElementTree.SubElement(data, f"{{{repo}}}location", href="repodata/primary.xml.gz")
+    # the checksum of repomd.xml changes with the contents of the repository
+    ElementTree.SubElement(repomd, f"{{{repo}}}revision").text = hashlib.sha256(ElementTree.tostring(metadata)).hexdigest()
+
+    with open(os.path.join(path, "repodata", "repomd.xml"), "wb") as file:
+        file.write(ElementTree.tostring(repomd))
+
+
+FOO_DEFAULT = "crate(foo/default)"
+
+BINARY_PACKAGES = [
+    devel_package("foo", "1.2.0"),
+    devel_package("foo", "1.2.0", [("crate(foo)", "EQ", "1.2.0")], feature="default"),
+    devel_package("foo", "1.2.0", [("crate(foo)", "EQ", "1.2.0")], feature="serde"),
+    # a range which contains the current version
+    devel_package("matching", "1.0.0", [rich_range(FOO_DEFAULT, "1.0.0", "2.0.0~")]),
+    # a range which does not contain the current version
+    devel_package("outdated", "1.0.0", [rich_range(FOO_DEFAULT, "0.1.0", "0.2.0~")]),
+    # alternatives of which only one contains the current version
+    devel_package("either", "1.0.0", [
+        f"({rich_range(FOO_DEFAULT, '0.1.0', '0.2.0~')} or {rich_range(FOO_DEFAULT, '1.0.0', '2.0.0~')})",
+    ]),
+    # alternatives of which none contains the current version
+    devel_package("neither", "1.0.0", [
+        f"({rich_range(FOO_DEFAULT, '0.1.0', '0.2.0~')} or {rich_range(FOO_DEFAULT, '3.0.0', '4.0.0~')})",
+    ]),
+    # a feature subpackage
+    devel_package("feature", "1.0.0", [rich_range("crate(foo/serde)", "1.0.0", "2.0.0~")]),
+    # unrelated requirements
+    package("other", "1.0", "x86_64", ["other"], ["libc.so.6"], "other-1.0-1.fc42.src.rpm"),
+]
+
+SOURCE_PACKAGES = [
+    package("rust-foo", "1.2.0", "src", [], []),
+    package("rust-matching", "1.0.0", "src", [], [rich_range(FOO_DEFAULT, "1.0.0", "2.0.0~")]),
+    package("rust-outdated", "1.0.0", "src", [], [rich_range(FOO_DEFAULT, "0.1.0", "0.2.0~")]),
+    package("rust-serdeuser", "1.0.0", "src", [], ["rust-foo+serde-devel"]),
+]
+
+
+class RichDepTest(unittest.TestCase):
+    def test_with(self):
+        self.assertEqual(
+            cratedeps.parse_rich_dep(rich_range(FOO_DEFAULT, "1.0.0", "2.0.0~")),
+            {FOO_DEFAULT: ((("GE", ("0", "1.0.0", None)), ("LT", ("0", "2.0.0~", None))),)},
+        )
+
+    def test_or(self):
+        dep = f"({rich_range(FOO_DEFAULT, '0.1.0', '0.2.0~')} or {rich_range(FOO_DEFAULT, '1.0.0', '2.0.0~')})"
+        self.assertEqual(
+            cratedeps.parse_rich_dep(dep),
+            {FOO_DEFAULT: (
+                (("GE", ("0", "0.1.0", None)), ("LT", ("0", "0.2.0~", None))),
+                (("GE", ("0", "1.0.0", None)), ("LT", ("0", "2.0.0~", None))),
+            )},
+        )
+
+    def test_without(self):
+        self.assertEqual(cratedeps.parse_rich_dep("(foo without bar)"), {"foo": ((),)})
+
+    def test_malformed(self):
+        self.assertEqual(cratedeps.parse_rich_dep("(foo with"), dict())
+
+
+class RepoIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.directory, "cache")
+
+        self.binary_repo = os.path.join(self.directory, "rawhide")
+        self.source_repo = os.path.join(self.directory, "rawhide-source")
+        write_repo(self.binary_repo, BINARY_PACKAGES)
+        write_repo(self.source_repo, SOURCE_PACKAGES)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def load_indexes(self) -> List[cratedeps.RepoIndex]:
+        return [cratedeps.load_index(repo, self.cache_dir) for repo in (self.binary_repo, self.source_repo)]
+
+    def test_crate_dependents(self):
+        self.assertEqual(cratedeps.crate_dependents(self.load_indexes(), "foo"), sorted([
+            # requirements between subpackages of the same crate
+            "rust-foo+default-devel-0:1.2.0-1.fc42.noarch",
+            "rust-foo+serde-devel-0:1.2.0-1.fc42.noarch",
+            "rust-either-devel-0:1.0.0-1.fc42.noarch",
+            "rust-feature-devel-0:1.0.0-1.fc42.noarch",
+            "rust-matching-devel-0:1.0.0-1.fc42.noarch",
+            # source packages from the other repository
+            "rust-matching-0:1.0.0-1.fc42.src",
+            "rust-serdeuser-0:1.0.0-1.fc42.src",
+        ]))
+
+    def test_source_nvr(self):
+        binary_index, source_index = self.load_indexes()
+
+        sources = set(package[5] for package in binary_index.packages)
+        self.assertIn("rust-foo-1.2.0-1.fc42", sources)
+        self.assertEqual(
+            set(package[5] for package in source_index.packages),
+            {"rust-foo-1.2.0-1.fc42", "rust-matching-1.0.0-1.fc42",
+             "rust-outdated-1.0.0-1.fc42", "rust-serdeuser-1.0.0-1.fc42"},
+        )
+
+    def test_cache(self):
+        self.load_indexes()
+
+        # the second time, indexes are loaded from the cache
+        with unittest.mock.patch.object(cratedeps, "build_index", side_effect=AssertionError):
+            indexes = self.load_indexes()
+        self.assertEqual(len(cratedeps.crate_dependents(indexes, "foo")), 7)
+
+    def test_outdated_cache_is_removed(self):
+        self.load_indexes()
+        before = set(glob.glob(os.path.join(self.cache_dir, "*.pickle")))
+        self.assertEqual(len(before), 2)
+
+        write_repo(self.binary_repo, BINARY_PACKAGES[:3])
+        cratedeps.load_index(self.binary_repo, self.cache_dir)
+
+        after = set(glob.glob(os.path.join(self.cache_dir, "*.pickle")))
+        self.assertEqual(len(after), 2)
+
+        # only the index of the modified repository was replaced
+        self.assertEqual(len(before & after), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+#!/usr/bin/python3
+
+"""
+This script checks the import time of every subcommand of the dispatcher against
+its budget. Subcommands whose dependencies are not installed are skipped.
+
+It can be run with `python3 -m unittest test_miscripts` or with pytest.
+"""
+
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+from typing import Tuple
+
+import miscripts
+
+
+class StartupBudgetTest(unittest.TestCase):
+    def check_budget(self, name: str, source: str) -> Tuple[int, str]:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, f"{name}.py")
+            with open(path, "w") as file:
+                file.write(source)
+
+            commands = {name: miscripts.Command(path, "test script", 50)}
+            with unittest.mock.patch.dict(miscripts.COMMANDS, commands):
+                with contextlib.redirect_stdout(io.StringIO()) as output:
+                    ret = miscripts.startup_budget(["--runs", "1", name])
+
+        return ret, output.getvalue()
+
+    def test_module_body_is_measured(self):
+        ret, output = self.check_budget("slow_script", "import time\n\ntime.sleep(0.2)\n")
+        self.assertEqual(ret, 1, output)
+        self.assertIn("OVER BUDGET", output)
+
+    def test_missing_dependency_is_skipped(self):
+        ret, output = self.check_budget("broken_script", "import not_installed_module\n")
+        self.assertEqual(ret, 0, output)
+        self.assertIn("skipped: No module named 'not_installed_module'", output)
+
+    def test_commands(self):
+        for name in miscripts.COMMANDS:
+            with self.subTest(command=name):
+                with contextlib.redirect_stdout(io.StringIO()) as output:
+                    ret = miscripts.startup_budget([name])
+                self.assertEqual(ret, 0, output.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+
+"""
+This script checks miscriptsd.py by running the daemon on a temporary socket,
+with fakes for the koji session and for listing buildroots.
+
+It can be run with `python3 -m unittest test_miscriptsd` or with pytest.
+"""
+
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from typing import List
+
+import miscriptsd
+
+
+class FakeKoji:
+    """This class stands in for koji sessions and `list_buildroot()`, and records how they are used."""
+
+    def __init__(self):
+        self.sessions = 0
+        self.calls: List[tuple] = list()
+        # NVRs for which listing the buildroot fails once
+        self.failures = set()
+
+    def session_factory(self) -> str:
+        self.sessions += 1
+        return f"session-{self.sessions}"
+
+    def buildroot_lister(self, session: str, nvr: str) -> List[str]:
+        self.calls.append((session, nvr))
+
+        if nvr in self.failures:
+            self.failures.remove(nvr)
+            raise ConnectionError("connection reset by peer")
+
+        return [f"rust-{nvr}-devel-1.0-1.fc42"]
+
+
+def start_daemon(socket_path: str, daemon: miscriptsd.Daemon):
+    thread = threading.Thread(target=miscriptsd.serve, args=(socket_path, daemon), daemon=True)
+    thread.start()
+
+    for _ in range(100):
+        if os.path.exists(socket_path):
+            try:
+                miscriptsd.Client(socket_path).close()
+                return
+            except (ConnectionRefusedError, FileNotFoundError):
+                # the stale socket was not replaced yet
+                pass
+        time.sleep(0.01)
+
+    raise TimeoutError("Daemon did not start.")
+
+
+class DaemonTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.directory, "miscripts.sock")
+
+        self.koji = FakeKoji()
+        self.daemon = miscriptsd.Daemon(
+            session_factory=self.koji.session_factory,
+            buildroot_lister=self.koji.buildroot_lister,
+        )
+
+        start_daemon(self.socket_path, self.daemon)
+        self.client = miscriptsd.Client(self.socket_path)
+
+    def tearDown(self):
+        self.client.close()
+        shutil.rmtree(self.directory)
+
+    def test_ping(self):
+        self.assertEqual(self.client.call("ping"), "pong")
+        self.assertEqual(self.client.call("ping"), "pong")
+
+    def test_list_buildroot_is_cached(self):
+        for _ in range(3):
+            self.assertEqual(self.client.call("list_buildroot", nvr="foo"), ["rust-foo-devel-1.0-1.fc42"])
+            self.assertEqual(self.client.call("list_buildroot", nvr="bar"), ["rust-bar-devel-1.0-1.fc42"])
+
+        self.assertEqual(self.koji.calls, [("session-1", "foo"), ("session-1", "bar")])
+        self.assertEqual(self.koji.sessions, 1)
+
+    def test_failure_resets_session(self):
+        self.koji.failures.add("foo")
+
+        with self.assertRaisesRegex(RuntimeError, "ConnectionError: connection reset by peer"):
+            self.client.call("list_buildroot", nvr="foo")
+
+        # the next call uses a new session, and failures are not cached
+        self.assertEqual(self.client.call("list_buildroot", nvr="foo"), ["rust-foo-devel-1.0-1.fc42"])
+        self.assertEqual(self.koji.calls, [("session-1", "foo"), ("session-2", "foo")])
+
+    def test_errors(self):
+        with self.assertRaisesRegex(RuntimeError, "ValueError: Unknown method: bogus"):
+            self.client.call("bogus")
+
+        with self.assertRaisesRegex(RuntimeError, "TypeError: .*unexpected keyword argument 'name'"):
+            self.client.call("list_buildroot", name="foo")
+
+        with self.assertRaisesRegex(RuntimeError, "TypeError: .*missing 1 required positional argument"):
+            self.client.call("list_buildroot")
+
+        # the connection can still be used after errors
+        self.assertEqual(self.client.call("ping"), "pong")
+
+    def test_refuse_live_socket(self):
+        with self.assertRaisesRegex(RuntimeError, "Another daemon is already listening"):
+            miscriptsd.serve(self.socket_path, miscriptsd.Daemon())
+
+        # the socket of the running daemon is still there
+        client = miscriptsd.Client(self.socket_path)
+        try:
+            self.assertEqual(client.call("ping"), "pong")
+        finally:
+            client.close()
+
+
+class StaleSocketTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.directory, "miscripts.sock")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_replace_stale_socket(self):
+        # a socket which was left behind by a daemon that was not stopped cleanly
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.socket_path)
+        stale.close()
+
+        start_daemon(self.socket_path, miscriptsd.Daemon())
+
+        client = miscriptsd.Client(self.socket_path)
+        try:
+            self.assertEqual(client.call("ping"), "pong")
+        finally:
+            client.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
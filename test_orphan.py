@@ -0,0 +1,163 @@
+#!/usr/bin/python3
+
+"""
+This script checks orphan.py against a local HTTP server which stands in for
+the dist-git API.
+
+It can be run with `python3 -m unittest test_orphan` or with pytest.
+"""
+
+import contextlib
+import http.server
+import importlib.util
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from typing import Dict, List
+
+import orphan
+
+
+class FakeDistGit(http.server.ThreadingHTTPServer):
+    """This class implements the orphan endpoint of dist-git and records all requests."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeDistGitHandler)
+
+        self.lock = threading.Lock()
+        self.requests: List[dict] = list()
+        # package name -> HTTP status codes to respond with before succeeding
+        self.failures: Dict[str, List[int]] = dict()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address
+        return f"http://{host}:{port}"
+
+    def calls(self, package: str) -> int:
+        return sum(1 for request in self.requests if request["package"] == package)
+
+
+class FakeDistGitHandler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        server: FakeDistGit = self.server
+
+        package = self.path.removeprefix("/_dg/orphan/rpms/")
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+
+        with server.lock:
+            server.requests.append({
+                "package": package,
+                "authorization": self.headers.get("Authorization"),
+                "body": body,
+            })
+            statuses = server.failures.get(package)
+            status = statuses.pop(0) if statuses else 200
+
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@unittest.skipUnless(importlib.util.find_spec("requests"), "requests is not installed")
+class OrphanPackagesTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeDistGit()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+        fd, self.log_path = tempfile.mkstemp(suffix=".jsonl")
+        os.close(fd)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        os.remove(self.log_path)
+
+    def orphan_packages(self, packages: List[str]) -> int:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return orphan.orphan_packages(
+                packages,
+                orphan.OrphanReason.Unmaintained,
+                "no longer maintained upstream",
+                "secret",
+                url=self.server.url,
+                workers=2,
+                rate=0,
+                retries=3,
+                backoff=0.01,
+                log_path=self.log_path,
+            )
+
+    def read_log(self) -> List[dict]:
+        with open(self.log_path) as file:
+            return [json.loads(line) for line in file]
+
+    def test_orphan_packages(self):
+        self.server.failures["flaky"] = [503, 503]
+        self.server.failures["missing"] = [404]
+
+        self.assertEqual(self.orphan_packages(["foo", "flaky", "missing"]), 1)
+
+        # server errors are retried, but client errors are not
+        self.assertEqual(self.server.calls("foo"), 1)
+        self.assertEqual(self.server.calls("flaky"), 3)
+        self.assertEqual(self.server.calls("missing"), 1)
+
+        for request in self.server.requests:
+            self.assertEqual(request["authorization"], "token secret")
+            self.assertEqual(request["body"], {
+                "orphan_reason": "Unmaintained upstream",
+                "orphan_reason_info": "no longer maintained upstream",
+            })
+
+        entries = sorted(self.read_log(), key=lambda entry: entry["package"])
+        self.assertEqual([(entry["package"], entry["status"]) for entry in entries], [
+            ("flaky", "ok"),
+            ("foo", "ok"),
+            ("missing", "failed"),
+        ])
+        self.assertIn("404", entries[2]["error"])
+
+    def test_retries_exhausted(self):
+        self.server.failures["down"] = [503] * 10
+
+        self.assertEqual(self.orphan_packages(["down"]), 1)
+        self.assertEqual(self.server.calls("down"), 4)
+        self.assertEqual(self.read_log()[0]["status"], "failed")
+
+    def test_resume(self):
+        self.server.failures["missing"] = [404]
+        self.assertEqual(self.orphan_packages(["foo", "bar", "missing"]), 1)
+
+        # packages which were orphaned according to the log are skipped,
+        # and packages which failed are tried again
+        self.server.requests.clear()
+        self.assertEqual(self.orphan_packages(["foo", "bar", "missing", "baz"]), 0)
+        self.assertEqual(sorted(request["package"] for request in self.server.requests), ["baz", "missing"])
+
+        self.assertEqual(orphan.read_results_log(self.log_path), {
+            "foo": "ok",
+            "bar": "ok",
+            "missing": "ok",
+            "baz": "ok",
+        })
+
+
+class ReadPackageListTest(unittest.TestCase):
+    def test_read_package_list(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".txt") as file:
+            file.write("# comment\nfoo\n\n  bar  \n")
+            file.flush()
+            self.assertEqual(orphan.read_package_list(file.name), ["foo", "bar"])
+
+
+if __name__ == "__main__":
+    unittest.main()
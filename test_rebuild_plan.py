@@ -0,0 +1,135 @@
+#!/usr/bin/python3
+
+"""
+This script checks how rebuild_plan.py groups packages into batches, based on
+dependency graphs which are given directly instead of being read from
+repository metadata.
+
+It can be run with `python3 -m unittest test_rebuild_plan` or with pytest.
+"""
+
+import contextlib
+import io
+import sys
+import unittest
+import unittest.mock
+
+from typing import List, Tuple
+
+import rebuild_plan
+
+# every graph maps packages to the set of packages which depend on them
+
+CHAIN = {
+    "seed": {"a"},
+    "a": {"b"},
+    "b": {"c"},
+    "c": set(),
+}
+
+DIAMOND = {
+    "seed": {"a", "b"},
+    "a": {"d"},
+    "b": {"d"},
+    "d": set(),
+}
+
+CYCLE = {
+    "seed": {"a", "x"},
+    "a": {"x"},
+    "x": {"y"},
+    "y": {"x", "z"},
+    "z": set(),
+}
+
+
+class FakeIndex:
+    """This class stands in for a RepoIndex which contains one package for the "seed" crate."""
+
+    packages = [("rust-seed-devel", "0", "1.0", "1.fc42", "noarch", "seed")]
+
+    def crate_packages(self, crate: str) -> List[int]:
+        return [0] if crate == "seed" else []
+
+
+class PlanBatchesTest(unittest.TestCase):
+    def test_chain(self):
+        self.assertEqual(rebuild_plan.plan_batches(CHAIN, {"seed"}), ([["a"], ["b"], ["c"]], []))
+
+    def test_diamond(self):
+        self.assertEqual(rebuild_plan.plan_batches(DIAMOND, {"seed"}), ([["a", "b"], ["d"]], []))
+
+    def test_cycle(self):
+        batches, cycles = rebuild_plan.plan_batches(CYCLE, {"seed"})
+
+        # the cycle depends on "a", so it is built in the second batch, even
+        # though "x" also depends on the seed directly
+        self.assertEqual(batches, [["a"], ["x", "y"], ["z"]])
+        self.assertEqual(cycles, [["x", "y"]])
+
+    def test_seeds_are_excluded(self):
+        graph = {
+            "seed": {"other", "a"},
+            "other": {"a", "b"},
+            "a": {"b"},
+            "b": set(),
+        }
+
+        self.assertEqual(rebuild_plan.plan_batches(graph, {"seed", "other"}), ([["a"], ["b"]], []))
+
+    def test_no_dependents(self):
+        self.assertEqual(rebuild_plan.plan_batches({"seed": set()}, {"seed"}), ([], []))
+
+    def test_strongly_connected_components(self):
+        nodes = sorted(node for node in CYCLE if node != "seed")
+
+        # components are returned in reverse topological order
+        self.assertEqual(rebuild_plan.strongly_connected_components(CYCLE, nodes), [["z"], ["x", "y"], ["a"]])
+
+    def test_long_chain(self):
+        # deep graphs must not hit the recursion limit
+        graph = {str(i): {str(i + 1)} for i in range(5000)}
+        graph["5000"] = set()
+
+        batches, cycles = rebuild_plan.plan_batches(graph, {"0"})
+        self.assertEqual(len(batches), 5000)
+        self.assertEqual(cycles, [])
+
+
+class MainTest(unittest.TestCase):
+    def run_main(self, *args: str) -> Tuple[int, str, str]:
+        argv = ["rebuild_plan.py", "--repo", "unused", *args, "seed"]
+
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(unittest.mock.patch.object(sys, "argv", argv))
+            stack.enter_context(unittest.mock.patch.object(rebuild_plan, "load_index", return_value=FakeIndex()))
+            stack.enter_context(unittest.mock.patch.object(rebuild_plan, "reverse_closure", return_value=CYCLE))
+            stdout = stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+            stderr = stack.enter_context(contextlib.redirect_stderr(io.StringIO()))
+
+            ret = rebuild_plan.main()
+
+        return ret, stdout.getvalue(), stderr.getvalue()
+
+    def test_plan(self):
+        ret, stdout, stderr = self.run_main()
+        self.assertEqual(ret, 0)
+        self.assertEqual(stdout, "# batch 1\na\n# batch 2\nx\ny\n# batch 3\nz\n")
+        self.assertEqual(stderr, "Dependency cycle between: x, y\n")
+
+    def test_batch(self):
+        ret, stdout, _ = self.run_main("--batch", "2")
+        self.assertEqual(ret, 0)
+        self.assertEqual(stdout, "x\ny\n")
+
+    def test_batch_out_of_range(self):
+        for batch in ("0", "4", "-1"):
+            with self.subTest(batch=batch):
+                ret, stdout, stderr = self.run_main("--batch", batch)
+                self.assertEqual(ret, 1)
+                self.assertEqual(stdout, "")
+                self.assertIn(f"Batch {batch} does not exist, the plan has 3 batch(es).", stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,193 @@
+#!/usr/bin/python3
+
+"""
+This script checks that queries using the trigram index of spec-glob-search.py
+return the same results as a full scan, and that incremental updates of the
+index leave it in the same state as building it from scratch.
+
+It can be run with `python3 -m unittest test_spec_glob_search` or with pytest.
+"""
+
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from typing import Dict, Set
+
+import miscripts
+
+specs = miscripts.load_command("spec-glob-search")
+
+SPECS = {
+    "foo.spec": "Name: foo\nVersion: 1.0\nLicense: MIT\nRequires: rust-serde\n",
+    "bar.spec": "Name: bar\nLICENSE: mit\nBuildRequires: cargo\n%files\n",
+    "baz.spec": "Name: baz\nabc\nSource0: x\n",
+    "qux.spec": "Name: qux\nbcdx\nfoofoobar\nbar\n",
+    "quux.spec": "Name: quux\nPatch1: y\n%global crate qux\nSummary: s\n",
+}
+
+PATTERNS = [
+    # literals
+    "Requires: rust-serde",
+    "Name: qux",
+    "zzzqqq",
+    # case-insensitive
+    "(?i)license: mit",
+    "(?i)NAME: BAZ",
+    # branches, also where one side has no trigrams
+    "a|bcd",
+    "abc|bcd",
+    "%files|%global crate",
+    # repeats that can or must occur
+    "(foo){0,}bar",
+    "(foo)+bar",
+    "(foo)*bar",
+    "x(abc){0,}",
+    "(?:Build)?Requires",
+    # groups
+    "(?:Source|Patch)[0-9]*: ",
+    "(Name): (qu+x)",
+    # lookarounds
+    "(?=Name)Name: foo",
+    "(?!Name)Summary",
+    "Version(?<=Version): 1",
+    "Name: (?!foo)ba",
+]
+
+
+def write_specs(directory: str, contents: Dict[str, str]):
+    for name, content in contents.items():
+        with open(os.path.join(directory, name), "w") as file:
+            file.write(content)
+
+
+def dump_index(index_path: str) -> Dict[str, Set[str]]:
+    """This function returns the contents of an index as mapping from trigrams to file names."""
+
+    connection = sqlite3.connect(index_path)
+    try:
+        names = dict(connection.execute("SELECT id, name FROM files"))
+
+        result = dict()
+        for trigram, blob in connection.execute("SELECT trigram, ids FROM postings"):
+            result[trigram] = set(names[file_id] for file_id in specs.decode_ids(blob))
+
+        # the posting lists referenced by every file must be exactly those that contain it
+        rows = dict(connection.execute("SELECT id, trigram FROM postings"))
+        for file_id, blob in connection.execute("SELECT id, trigrams FROM files"):
+            referenced = set(rows[row_id] for row_id in specs.decode_ids(blob))
+            contained = set(trigram for trigram, files in result.items() if names[file_id] in files)
+            assert referenced == contained, names[file_id]
+
+        return result
+
+    finally:
+        connection.close()
+
+
+class QueryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.directory, specs.INDEX_NAME)
+        write_specs(self.directory, SPECS)
+        specs.update_index(self.directory, self.index_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_query_matches_full_scan(self):
+        paths = specs.get_specs(self.directory)
+
+        for pattern in PATTERNS:
+            with self.subTest(pattern=pattern):
+                compiled = re.compile(pattern)
+                candidates = specs.query_index(self.directory, self.index_path, compiled)
+
+                expected = specs.analyze_specs(paths, compiled)
+                self.assertEqual(specs.analyze_specs(candidates, compiled), expected)
+
+    def test_query_narrows_down_files(self):
+        candidates = specs.query_index(self.directory, self.index_path, re.compile("Requires: rust-serde"))
+        self.assertEqual(candidates, [os.path.join(self.directory, "foo.spec")])
+
+        candidates = specs.query_index(self.directory, self.index_path, re.compile("a|bcd"))
+        self.assertEqual(len(candidates), len(SPECS))
+
+    def test_query_does_not_wait_for_updates(self):
+        connection = sqlite3.connect(self.index_path)
+        connection.execute("BEGIN IMMEDIATE")
+
+        try:
+            candidates = specs.query_index(self.directory, self.index_path, re.compile("Name: quux"))
+            self.assertEqual(candidates, [os.path.join(self.directory, "quux.spec")])
+        finally:
+            connection.rollback()
+            connection.close()
+
+    def test_query_outdated_index(self):
+        connection = sqlite3.connect(self.index_path)
+        connection.execute("PRAGMA user_version = 0")
+        connection.close()
+
+        with self.assertRaises(ValueError):
+            specs.query_index(self.directory, self.index_path, re.compile("Name"))
+
+
+class UpdateTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.directory, specs.INDEX_NAME)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_incremental_update(self):
+        write_specs(self.directory, SPECS)
+        self.assertEqual(specs.update_index(self.directory, self.index_path), (len(SPECS), 0))
+        self.assertEqual(specs.update_index(self.directory, self.index_path), (0, 0))
+
+        before = dump_index(self.index_path)
+        self.assertEqual(before["erd"], {"foo.spec"})
+        self.assertEqual(before["abc"], {"baz.spec"})
+
+        # modify, add, and remove one file each
+        path = os.path.join(self.directory, "foo.spec")
+        write_specs(self.directory, {"foo.spec": "Name: foo\nRequires: rust-tokio\n"})
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+        write_specs(self.directory, {"new.spec": "Name: new\nLicense: MIT\n"})
+        os.remove(os.path.join(self.directory, "baz.spec"))
+
+        self.assertEqual(specs.update_index(self.directory, self.index_path), (2, 1))
+
+        after = dump_index(self.index_path)
+
+        # posting lists which became empty are deleted, stale entries are removed
+        self.assertNotIn("erd", after)
+        self.assertNotIn("abc", after)
+        self.assertEqual(after["tok"], {"foo.spec"})
+        self.assertEqual(after["nam"], {"foo.spec", "bar.spec", "qux.spec", "quux.spec", "new.spec"})
+        self.assertEqual(after["mit"], {"bar.spec", "new.spec"})
+
+        # the result is the same as building the index from scratch
+        fresh_path = os.path.join(self.directory, "fresh.sqlite")
+        specs.update_index(self.directory, fresh_path)
+        self.assertEqual(after, dump_index(fresh_path))
+
+    def test_outdated_index_is_rebuilt(self):
+        write_specs(self.directory, SPECS)
+        specs.update_index(self.directory, self.index_path)
+
+        connection = sqlite3.connect(self.index_path)
+        connection.execute("PRAGMA user_version = 0")
+        connection.close()
+
+        self.assertEqual(specs.update_index(self.directory, self.index_path), (len(SPECS), 0))
+
+
+if __name__ == "__main__":
+    unittest.main()